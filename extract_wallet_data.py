@@ -5,11 +5,14 @@ Extracts all data from the CouchDB backend for migration to Cashew
 """
 
 import requests
-import json
-import time
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from typing import Dict, List, Any
 import base64
 import os
+import sqlite3
 import dotenv
 
 dotenv.load_dotenv()
@@ -17,13 +20,91 @@ dotenv.load_dotenv()
 BUDGETBAKERS_DATABASE_ID = os.getenv('BUDGETBAKERS_DATABASE_ID')
 BUDGETBAKERS_AUTH_TOKEN = os.getenv('BUDGETBAKERS_AUTH_TOKEN')
 
+class JsonArrayWriter:
+    """Append documents to a JSON array file one at a time
+
+    Writes go to a temporary file that only replaces the target on close(),
+    so an interrupted extraction never leaves a truncated array behind.
+    """
+    def __init__(self, path, option=0):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.option = option
+        self.count = 0
+        self.file = None
+
+    def append(self, doc):
+        # Open lazily so categories without documents produce no file
+        if self.file is None:
+            self.file = open(self.tmp_path, 'wb')
+            self.file.write(b'[')
+        elif self.count:
+            self.file.write(b',')
+        self.file.write(orjson.dumps(doc, option=self.option))
+        self.count += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.write(b']')
+            self.file.close()
+            self.file = None
+            os.replace(self.tmp_path, self.path)
+
+    def discard(self):
+        """Drop everything written so far, leaving any previous file untouched"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            os.remove(self.tmp_path)
+
+
 class WalletDataExtractor:
-    def __init__(self):
+    # Document ID prefix (before the first underscore) -> category
+    _PREFIX_MAP = {
+        'Record': 'transactions',
+        '-Debt': 'debts',
+        '-Account': 'accounts',
+        '-Category': 'categories',
+        '-Currency': 'currencies',
+        '-HashTag': 'hashtags',
+        '-Budget': 'budgets',
+    }
+    _SKIP = {'-Notification'}
+    CATEGORIES = ['transactions', 'debts', 'accounts', 'categories', 'currencies', 'hashtags', 'budgets', 'other']
+
+    def __init__(self, max_workers=16, cache_path='output/.wallet_cache.sqlite', pretty=False):
         self.base_url = f"https://couch-prod-asia-1.budgetbakers.com/{BUDGETBAKERS_DATABASE_ID}"
-        self.headers = {
+        self.max_workers = max_workers
+        self.cache_path = cache_path
+        # Indent output files only when they are meant to be read by a person
+        self.pretty = pretty
+        
+        # Shared session so batches reuse keep-alive connections
+        self.session = requests.Session()
+        # Back off only when the server pushes back, honouring Retry-After
+        retries = Retry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=['GET', 'POST'],
+            respect_retry_after_header=True
+        )
+        # Everything goes to one host: keep one pooled connection per worker and
+        # block rather than open throwaway connections that each pay a TLS handshake
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=max_workers,
+            pool_block=True,
+            max_retries=retries
+        )
+        self.session.mount('https://', adapter)
+        # Set once here so individual requests only carry their own params/body
+        self.session.headers.update({
             'authorization': f'Basic {BUDGETBAKERS_AUTH_TOKEN}',
-        }
-
+            'content-type': 'application/json',
+            # gzip/deflate, plus br when brotli is installed; decoded transparently
+            'accept-encoding': requests.utils.DEFAULT_ACCEPT_ENCODING,
+        })
 
     def get_changes(self, since=0, limit=1000):
         """Get changes from CouchDB"""
@@ -35,9 +116,10 @@ class WalletDataExtractor:
             'limit': limit
         }
         
-        response = requests.get(url, headers=self.headers, params=params)
+        response = self.session.get(url, params=params)
         response.raise_for_status()
-        return response.json()
+        print(f"Changes feed encoding: {response.headers.get('Content-Encoding', 'identity')}")
+        return orjson.loads(response.content)
 
     def get_document(self, doc_id, rev):
         """Get a specific document"""
@@ -48,120 +130,205 @@ class WalletDataExtractor:
             "docs": [{"id": doc_id, "rev": rev}]
         }
         
-        response = requests.post(url, headers=self.headers, params=params, json=data)
+        response = self.session.post(url, params=params, data=orjson.dumps(data))
         response.raise_for_status()
-        return response.json()
+        return orjson.loads(response.content)
 
-    def get_all_documents(self, batch_size=50):
-        """Get all documents in batches"""
-        print("Getting all document IDs...")
-        changes = self.get_changes(limit=10000)  # Get all changes
-        
-        all_docs = []
-        doc_ids = []
+    def _fetch_batch(self, batch):
+        """Fetch one batch of (doc_id, rev) pairs via _bulk_get"""
+        docs_data = [{"id": doc_id, "rev": rev} for doc_id, rev in batch]
+        data = {"docs": docs_data}
         
-        for change in changes['results']:
-            doc_id = change['id']
-            rev = change['changes'][0]['rev']
-            doc_ids.append((doc_id, rev))
+        response = self.session.post(
+            f"{self.base_url}/_bulk_get",
+            params={'revs': 'true', 'latest': 'true'},
+            data=orjson.dumps(data)
+        )
+        response.raise_for_status()
+        batch_result = orjson.loads(response.content)
+        return batch_result['results']
+
+    def _fetch_batch_safe(self, numbered_batch):
+        """Fetch a numbered batch, logging failures instead of raising"""
+        batch_num, total_batches, batch = numbered_batch
+        print(f"Processing batch {batch_num}/{total_batches}")
         
-        print(f"Found {len(doc_ids)} documents")
+        try:
+            return self._fetch_batch(batch)
+        except Exception as e:
+            print(f"Error processing batch {batch_num}: {e}")
+            return []
+
+    def open_cache(self):
+        """Open the local document cache keyed by (doc_id, rev)"""
+        cache = sqlite3.connect(self.cache_path)
+        cache.execute("PRAGMA journal_mode=WAL")
+        cache.execute("""
+            CREATE TABLE IF NOT EXISTS doc (
+                id TEXT NOT NULL, rev TEXT NOT NULL, body BLOB NOT NULL,
+                PRIMARY KEY (id, rev)
+            )
+        """)
+        cache.execute("CREATE TEMP TABLE wanted (id TEXT NOT NULL, rev TEXT NOT NULL, PRIMARY KEY (id, rev))")
+        return cache
+
+    def _iter_encoded_documents(self, batch_size=100):
+        """Yield (result, JSON bytes) pairs so each result is serialized only once"""
+        cache = self.open_cache()
+        try:
+            yield from self._iter_changed_documents(cache, batch_size)
+        finally:
+            cache.close()
+
+    def list_changes(self, page_size=10000):
+        """Return the current (doc_id, rev) of every document, paging through _changes"""
+        revs = {}
+        since = 0
         
-        # Process in batches
-        for i in range(0, len(doc_ids), batch_size):
-            batch = doc_ids[i:i + batch_size]
-            print(f"Processing batch {i//batch_size + 1}/{(len(doc_ids) + batch_size - 1)//batch_size}")
+        while True:
+            changes = self.get_changes(since=since, limit=page_size)
+            results = changes['results']
             
-            # Prepare batch request
-            docs_data = [{"id": doc_id, "rev": rev} for doc_id, rev in batch]
-            data = {"docs": docs_data}
+            # A document edited mid-listing shows up again later; keep its newest rev
+            for change in results:
+                revs[change['id']] = change['changes'][0]['rev']
             
-            try:
-                response = requests.post(
-                    f"{self.base_url}/_bulk_get",
-                    headers=self.headers,
-                    params={'revs': 'true', 'latest': 'true'},
-                    json=data
+            if len(results) < page_size:
+                break
+            since = changes['last_seq']
+        
+        return list(revs.items())
+
+    def _iter_changed_documents(self, cache, batch_size):
+        """Fetch only revisions missing from the cache via _bulk_get"""
+        print("Getting all document IDs...")
+        doc_ids = self.list_changes()
+        
+        cache.executemany("INSERT OR IGNORE INTO wanted (id, rev) VALUES (?, ?)", doc_ids)
+        
+        # Revisions that are no longer current will never be requested again
+        cache.execute("""
+            DELETE FROM doc WHERE NOT EXISTS (
+                SELECT 1 FROM wanted WHERE wanted.id = doc.id AND wanted.rev = doc.rev
+            )
+        """)
+        cache.commit()
+        
+        cached = set()
+        for doc_id, rev, body in cache.execute(
+            "SELECT doc.id, doc.rev, doc.body FROM doc JOIN wanted USING (id, rev)"
+        ):
+            cached.add((doc_id, rev))
+            yield orjson.loads(body), body
+        
+        missing = [key for key in doc_ids if key not in cached]
+        print(f"Found {len(doc_ids)} documents ({len(cached)} cached, {len(missing)} to fetch)")
+        
+        # Process batches in parallel over the shared session
+        total_batches = (len(missing) + batch_size - 1) // batch_size
+        batches = [
+            (i // batch_size + 1, total_batches, missing[i:i + batch_size])
+            for i in range(0, len(missing), batch_size)
+        ]
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for (_, _, batch), results in zip(batches, executor.map(self._fetch_batch_safe, batches)):
+                revs = dict(batch)
+                encoded = [(result, orjson.dumps(result)) for result in results]
+                cache.executemany(
+                    "INSERT OR REPLACE INTO doc (id, rev, body) VALUES (?, ?, ?)",
+                    [
+                        (result['id'], revs[result['id']], body)
+                        for result, body in encoded
+                        if result.get('docs') and 'ok' in result['docs'][0]
+                    ]
                 )
-                response.raise_for_status()
-                batch_result = response.json()
-                all_docs.extend(batch_result['results'])
-                
-                # Small delay to avoid overwhelming the server
-                time.sleep(0.1)
-                
-            except Exception as e:
-                print(f"Error processing batch {i//batch_size + 1}: {e}")
-                continue
+                cache.commit()
+                yield from encoded
+
+    def categorize_documents(self, all_docs, categories=None):
+        """Categorize documents by type into lists (or any objects with append)"""
+        if categories is None:
+            categories = {category: [] for category in self.CATEGORIES}
         
-        return all_docs
-
-    def categorize_documents(self, all_docs):
-        """Categorize documents by type"""
-        categories = {
-            'transactions': [],
-            'debts': [],
-            'accounts': [],
-            'categories': [],
-            'currencies': [],
-            'hashtags': [],
-            'budgets': [],
-            'other': []
-        }
+        # Bind each bucket's append once instead of looking it up per document
+        appenders = {head: categories[bucket].append for head, bucket in self._PREFIX_MAP.items()}
+        other_append = categories['other'].append
+        skip = self._SKIP
         
         for doc_result in all_docs:
-            if 'docs' in doc_result and doc_result['docs']:
-                doc = doc_result['docs'][0].get('ok', {})
-                doc_id = doc.get('_id', '')
-                
-                if doc_id.startswith('Record_'):
-                    categories['transactions'].append(doc)
-                elif doc_id.startswith('-Debt_'):
-                    categories['debts'].append(doc)
-                elif doc_id.startswith('-Account_'):
-                    categories['accounts'].append(doc)
-                elif doc_id.startswith('-Category_'):
-                    categories['categories'].append(doc)
-                elif doc_id.startswith('-Currency_'):
-                    categories['currencies'].append(doc)
-                elif doc_id.startswith('-HashTag_'):
-                    categories['hashtags'].append(doc)
-                elif doc_id.startswith('-Budget_'):
-                    categories['budgets'].append(doc)
-                elif doc_id.startswith('-Notification_'):
-                    continue
-                else:
-                    categories['other'].append(doc)
+            docs = doc_result.get('docs')
+            if not docs:
+                continue
+            doc = docs[0].get('ok')
+            if not doc:
+                # Error entries (e.g. missing revisions) carry no document
+                continue
+            
+            head, sep, _ = doc.get('_id', '').partition('_')
+            append = appenders.get(head) if sep else None
+            if append is not None:
+                append(doc)
+            elif not (sep and head in skip):
+                other_append(doc)
         
         return categories
 
-    def save_data(self, data, filename):
-        """Save data to JSON file"""
-        with open(f"output/{filename}", 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-        print(f"Saved {len(data)} items to {filename}")
+    def _dump_option(self):
+        """orjson options for output files"""
+        option = orjson.OPT_NON_STR_KEYS
+        if self.pretty:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def stream_to_ndjson(self, encoded_items, filename):
+        """Write pre-encoded (item, bytes) pairs as NDJSON while passing the items through"""
+        path = f"output/{filename}"
+        tmp_path = f"{path}.tmp"
+        count = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                for item, body in encoded_items:
+                    f.write(body)
+                    f.write(b'\n')
+                    count += 1
+                    yield item
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        # Only a complete dump replaces the previous one
+        os.replace(tmp_path, path)
+        print(f"Saved {count} items to {filename}")
 
     def extract_all_data(self):
         """Main extraction function"""
         print("Starting Wallet by BudgetBakers data extraction...")
         
-        # Get all documents
-        all_docs = self.get_all_documents()
-        
-        # Categorize documents
-        categorized = self.categorize_documents(all_docs)
+        # Stream documents into the raw dump and straight into per-category
+        # files as they arrive, so no category list is ever held in memory
+        writers = {
+            category: JsonArrayWriter(f"output/wallet_{category}.json", self._dump_option())
+            for category in self.CATEGORIES
+        }
+        all_docs = self.stream_to_ndjson(self._iter_encoded_documents(), "wallet_all_data.ndjson")
+        try:
+            self.categorize_documents(all_docs, writers)
+        except BaseException:
+            # Keep the previous output files rather than publishing partial ones
+            all_docs.close()
+            for writer in writers.values():
+                writer.discard()
+            raise
         
-        # Save categorized data
-        for category, docs in categorized.items():
-            if docs:
-                filename = f"wallet_{category}.json"
-                self.save_data(docs, filename)
-                print(f"{category}: {len(docs)} documents")
+        for writer in writers.values():
+            writer.close()
         
-        # Save raw data
-        self.save_data(all_docs, "wallet_all_data.json")
+        counts = {category: writer.count for category, writer in writers.items() if writer.count}
+        for category, count in counts.items():
+            print(f"Saved {count} items to wallet_{category}.json")
+            print(f"{category}: {count} documents")
         
-        return categorized
+        return counts
 
 if __name__ == "__main__":
     extractor = WalletDataExtractor()
@@ -4,30 +4,68 @@ Wallet by BudgetBakers to Cashew SQLite Migration Script (CLEAN VERSION)
 Creates a fresh Cashew database with only the migrated Wallet data
 """
 
-import json
+import orjson
+import re
 import sqlite3
-import uuid
 import time
 import os
 from datetime import datetime, timezone
 from typing import Dict, List, Any, Optional
 
 class WalletToCashewCleanMigrator:
+    # date_time_modified stamped on every migrated row (same as the schema default)
+    DATE_TIME_MODIFIED = 1757158578
+    
     def __init__(self, cashew_db_path: str):
         self.cashew_db_path = cashew_db_path
+        
+        # Run-wide "now", used wherever Wallet data has no timestamp
+        self.now_s = int(time.time())
+        self.now_ms = self.now_s * 1000
         self.accounts = {}
         self.categories = {}
         self.currencies = {}
         self.debts = []
         self.transactions = []
+        self.active_accounts = []
+        self.active_categories = []
+        self.active_debts = []
+        self.active_transactions = []
+        self.active_debt_ids = frozenset()
+        self.debt_to_txns = {}
+        self.debt_linked_count = 0
+        self.deferred_indexes = []
+        self._ts_conv = self.timestamp_to_unix
+        
+        # Wallet ID -> Cashew primary key, filled as wallets/categories are created
+        self.account_to_wallet_pk: Dict[str, str] = {}
+        self.category_to_pk: Dict[str, str] = {}
         
         # Create a fresh database
         if os.path.exists(cashew_db_path):
             os.remove(cashew_db_path)
         
-        self.conn = sqlite3.connect(cashew_db_path)
+        # Transactions are managed explicitly with BEGIN/COMMIT. No column type
+        # conversion is needed, and only a handful of distinct statements run.
+        self.conn = sqlite3.connect(
+            cashew_db_path,
+            isolation_level=None,
+            detect_types=0,
+            cached_statements=32
+        )
         self.cursor = self.conn.cursor()
         
+        # Bulk-load settings for a brand-new file nobody else has open
+        for pragma in (
+            "journal_mode=WAL",
+            "synchronous=NORMAL",
+            "temp_store=MEMORY",
+            "cache_size=-65536",
+            "locking_mode=EXCLUSIVE",
+            "mmap_size=268435456",
+        ):
+            self.cursor.execute(f"PRAGMA {pragma}")
+        
         # Create the database schema
         self.create_schema()
         
@@ -54,12 +92,18 @@ class WalletToCashewCleanMigrator:
         with open('cashew_schema.sql', 'r', encoding='utf-8') as f:
             schema_sql = f.read()
         
-        # Split by semicolon and execute each statement
-        statements = [stmt.strip() for stmt in schema_sql.split(';') if stmt.strip()]
+        # sqlite_sequence is created by SQLite itself with the first AUTOINCREMENT table
+        schema_sql = re.sub(r'CREATE TABLE sqlite_sequence\b[^;]*;', '', schema_sql)
+        
+        # Secondary indexes are built after the bulk load (see create_indexes):
+        # one sorted build is far cheaper than updating the B-tree on every INSERT.
+        # Triggers stay in the script so they fire for the migrated rows
+        index_pattern = re.compile(r'CREATE\s+(?:UNIQUE\s+)?INDEX\b[^;]*;', re.IGNORECASE)
+        self.deferred_indexes = index_pattern.findall(schema_sql)
+        schema_sql = index_pattern.sub('', schema_sql)
         
-        for statement in statements:
-            if statement and not statement.startswith('CREATE TABLE sqlite_sequence'):
-                self.cursor.execute(statement)
+        # Hand the whole script to SQLite's parser; the transaction stays open for the settings row
+        self.cursor.executescript(f"BEGIN;\n{schema_sql}")
         
         # Load default app settings
         with open('cashew_app_settings.json', 'r', encoding='utf-8') as f:
@@ -68,7 +112,7 @@ class WalletToCashewCleanMigrator:
         self.cursor.execute("""
             INSERT INTO app_settings (settings_j_s_o_n, date_updated)
             VALUES (?, ?)
-        """, (default_settings, int(time.time())))
+        """, (default_settings, self.now_s))
         
         self.conn.commit()
         print("✅ Fresh Cashew database schema created from cashew_schema.sql")
@@ -78,36 +122,73 @@ class WalletToCashewCleanMigrator:
         print("Loading extracted Wallet data...")
         
         # Load accounts
-        with open('output/wallet_accounts.json', 'r', encoding='utf-8') as f:
-            accounts_data = json.load(f)
-            for account in accounts_data:
-                self.accounts[account['_id']] = account
+        with open('output/wallet_accounts.json', 'rb') as f:
+            self.accounts = {account['_id']: account for account in orjson.loads(f.read())}
         
         # Load categories
-        with open('output/wallet_categories.json', 'r', encoding='utf-8') as f:
-            categories_data = json.load(f)
-            for category in categories_data:
-                self.categories[category['_id']] = category
+        with open('output/wallet_categories.json', 'rb') as f:
+            self.categories = {category['_id']: category for category in orjson.loads(f.read())}
         
         # Load currencies
-        with open('output/wallet_currencies.json', 'r', encoding='utf-8') as f:
-            currencies_data = json.load(f)
-            for currency in currencies_data:
-                self.currencies[currency['_id']] = currency
+        with open('output/wallet_currencies.json', 'rb') as f:
+            self.currencies = {currency['_id']: currency for currency in orjson.loads(f.read())}
         
         # Load debts
-        with open('output/wallet_debts.json', 'r', encoding='utf-8') as f:
-            self.debts = json.load(f)
+        with open('output/wallet_debts.json', 'rb') as f:
+            self.debts = orjson.loads(f.read())
         
         # Load transactions
-        with open('output/wallet_transactions.json', 'r', encoding='utf-8') as f:
-            self.transactions = json.load(f)
+        with open('output/wallet_transactions.json', 'rb') as f:
+            self.transactions = orjson.loads(f.read())
+        
+        # Filter out deleted items once; everything after this works on the active lists
+        self.active_accounts = [a for a in self.accounts.values() if not a.get('deleted', False)]
+        self.active_categories = [c for c in self.categories.values() if not c.get('deleted', False)]
+        self.active_debts = [d for d in self.debts if not d.get('deleted', False)]
+        self.active_transactions = [t for t in self.transactions if not t.get('deleted', False)]
+        
+        # Debt IDs that refObjects can link to, for O(1) membership checks
+        self.active_debt_ids = frozenset(d['_id'] for d in self.active_debts)
+        
+        # Index transactions by the debts they reference, in one pass; the
+        # summaries read from this instead of rescanning the transactions
+        self.debt_to_txns = {}
+        self.debt_linked_count = 0
+        for transaction in self.active_transactions:
+            ref_ids = dict.fromkeys(ref_obj['id'] for ref_obj in transaction.get('refObjects') or ())
+            for ref_id in ref_ids:
+                self.debt_to_txns.setdefault(ref_id, []).append(transaction)
+            if not self.active_debt_ids.isdisjoint(ref_ids):
+                self.debt_linked_count += 1
+        
+        # Wallet stores transaction dates as epoch milliseconds; when every one is
+        # numeric, skip the type dispatch and ISO fallback in timestamp_to_unix
+        if all(isinstance(t.get('date', 0), (int, float)) for t in self.active_transactions):
+            self._ts_conv = self.ms_to_unix
+        else:
+            self._ts_conv = self.timestamp_to_unix
         
         print(f"Loaded: {len(self.accounts)} accounts, {len(self.categories)} categories, {len(self.debts)} debts, {len(self.transactions)} transactions")
     
+    def create_indexes(self):
+        """Create the secondary indexes deferred from the schema"""
+        if not self.deferred_indexes:
+            return
+        
+        print("Creating indexes...")
+        # One statement at a time: executescript would commit the load transaction
+        for statement in self.deferred_indexes:
+            self.cursor.execute(statement)
+        print(f"Created {len(self.deferred_indexes)} indexes")
+    
     def generate_id(self) -> str:
         """Generate a UUID for Cashew database"""
-        return str(uuid.uuid4())
+        # Random UUID (version 4) built directly from os.urandom, skipping uuid.UUID
+        b = bytearray(os.urandom(16))
+        b[6] = (b[6] & 0x0F) | 0x40  # version 4
+        b[8] = (b[8] & 0x3F) | 0x80  # RFC 4122 variant
+        h = b.hex()
+        return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
     
     def timestamp_to_unix(self, timestamp) -> int:
         """Convert Wallet timestamp to Unix timestamp"""
@@ -118,12 +199,17 @@ class WalletToCashewCleanMigrator:
                 dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
                 return int(dt.timestamp())
             except:
-                return int(time.time())
+                return self.now_s
         elif isinstance(timestamp, (int, float)):
             # Wallet uses milliseconds, convert to seconds
             return int(timestamp // 1000)
         else:
-            return int(time.time())
+            return self.now_s
+    
+    @staticmethod
+    def ms_to_unix(timestamp) -> int:
+        """Convert a Wallet millisecond timestamp to Unix seconds"""
+        return int(timestamp // 1000)
     
     def format_amount(self, amount: float) -> float:
         """Format amount for Cashew - remove decimal places (Wallet by BudgetBakers includes 2 decimals)"""
@@ -136,11 +222,12 @@ class WalletToCashewCleanMigrator:
         print("Creating wallets...")
         
         wallet_order = 0
+        ts = self.timestamp_to_unix
+        now_ms = self.now_ms
+        date_time_modified = self.DATE_TIME_MODIFIED
+        rows = []
         
-        for account_id, account in self.accounts.items():
-            if account.get('deleted', False):
-                continue
-                
+        for account in self.active_accounts:
             wallet_pk = self.generate_id()
             name = account.get('name', 'Unknown Account')
             currency = account.get('currency', 'PKR')
@@ -148,18 +235,13 @@ class WalletToCashewCleanMigrator:
             # Map currency format
             currency_format = f"[0,1]" if currency == 'PKR' else f"[0,1]"
             
-            self.cursor.execute("""
-                INSERT INTO wallets (wallet_pk, name, colour, icon_name, date_created, 
-                                   date_time_modified, "order", currency, currency_format, 
-                                   decimals, home_page_widget_display)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+            rows.append((
                 wallet_pk,
                 name,
                 None,  # colour
                 None,  # icon_name
-                self.timestamp_to_unix(account.get('created', int(time.time() * 1000))),
-                1757158578,  # date_time_modified
+                ts(account.get('created', now_ms)),
+                date_time_modified,
                 wallet_order,
                 currency.lower(),
                 currency_format,
@@ -168,22 +250,28 @@ class WalletToCashewCleanMigrator:
             ))
             
             # Store mapping for later use
-            account['cashew_wallet_pk'] = wallet_pk
+            self.account_to_wallet_pk[account['_id']] = wallet_pk
             wallet_order += 1
         
-        self.conn.commit()
-        print(f"Created {len([a for a in self.accounts.values() if not a.get('deleted', False)])} wallets")
+        self.cursor.executemany("""
+            INSERT INTO wallets (wallet_pk, name, colour, icon_name, date_created, 
+                               date_time_modified, "order", currency, currency_format, 
+                               decimals, home_page_widget_display)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        print(f"Created {len(self.active_accounts)} wallets")
     
     def create_categories(self):
         """Create categories in Cashew database"""
         print("Creating categories...")
         
         category_order = 0
+        ts = self.timestamp_to_unix
+        now_ms = self.now_ms
+        date_time_modified = self.DATE_TIME_MODIFIED
+        rows = []
         
-        for category_id, category in self.categories.items():
-            if category.get('deleted', False):
-                continue
-                
+        for category in self.active_categories:
             category_pk = self.generate_id()
             name = category.get('name', 'Unknown Category')
             
@@ -193,19 +281,14 @@ class WalletToCashewCleanMigrator:
             # Determine if it's income or expense
             is_income = 1 if category.get('type') == 'income' else 0
             
-            self.cursor.execute("""
-                INSERT INTO categories (category_pk, name, colour, icon_name, emoji_icon_name,
-                                      date_created, date_time_modified, "order", income, 
-                                      method_added, main_category_pk)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+            rows.append((
                 category_pk,
                 mapped_name,
                 None,  # colour
                 None,  # icon_name
                 None,  # emoji_icon_name
-                self.timestamp_to_unix(category.get('created', int(time.time() * 1000))),
-                1757158578,  # date_time_modified
+                ts(category.get('created', now_ms)),
+                date_time_modified,
                 category_order,
                 is_income,
                 None,  # method_added
@@ -213,25 +296,33 @@ class WalletToCashewCleanMigrator:
             ))
             
             # Store mapping for later use
-            category['cashew_category_pk'] = category_pk
+            self.category_to_pk[category['_id']] = category_pk
             category_order += 1
         
-        self.conn.commit()
-        print(f"Created {len([c for c in self.categories.values() if not c.get('deleted', False)])} categories")
+        self.cursor.executemany("""
+            INSERT INTO categories (category_pk, name, colour, icon_name, emoji_icon_name,
+                                  date_created, date_time_modified, "order", income, 
+                                  method_added, main_category_pk)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        print(f"Created {len(self.active_categories)} categories")
     
     def create_objectives_from_debts(self):
         """Convert Wallet debts to Cashew objectives (loans) following Cashew's loan system"""
         print("Converting debts to objectives (loans)...")
         
         objective_order = 0
-        
-        for debt in self.debts:
-            if debt.get('deleted', False):
-                continue
-                
+        ts = self.timestamp_to_unix
+        now_ms = self.now_ms
+        date_time_modified = self.DATE_TIME_MODIFIED
+        format_amount = self.format_amount
+        account_to_wallet_pk = self.account_to_wallet_pk
+        rows = []
+        
+        for debt in self.active_debts:
             objective_pk = self.generate_id()
             name = debt.get('name', 'Unknown Debt')
-            amount = self.format_amount(abs(float(debt.get('amount', 0))))
+            amount = format_amount(abs(float(debt.get('amount', 0))))
             
             # According to Cashew documentation:
             # - Loans lent out (type=1) are recorded as income objectives
@@ -240,31 +331,23 @@ class WalletToCashewCleanMigrator:
             is_income = 1 if debt_type == 1 else 0  # type=1 means lent out (income)
             
             # Get wallet reference (accountId -> wallet_fk)
-            account_id = debt.get('accountId')
-            wallet_pk = '0'  # Default wallet
-            if account_id and account_id in self.accounts:
-                wallet_pk = self.accounts[account_id].get('cashew_wallet_pk', '0')
+            wallet_pk = account_to_wallet_pk.get(debt.get('accountId'), '0')  # '0' = default wallet
             
             # Calculate end date if available
             end_date = None
             if debt.get('payBackTime'):
-                end_date = self.timestamp_to_unix(debt['payBackTime'])
-            
-            self.cursor.execute("""
-                INSERT INTO objectives (objective_pk, type, name, amount, "order", colour,
-                                      date_created, end_date, date_time_modified, icon_name,
-                                      emoji_icon_name, income, pinned, archived, wallet_fk)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+                end_date = ts(debt['payBackTime'])
+            
+            rows.append((
                 objective_pk,
                 0,  # type (0 = objective/loan)
                 name,
                 amount,
                 objective_order,
                 None,  # colour
-                self.timestamp_to_unix(debt.get('date', int(time.time() * 1000))),
+                ts(debt.get('date', now_ms)),
                 end_date,
-                1757158578,  # date_time_modified
+                date_time_modified,
                 None,  # icon_name
                 None,  # emoji_icon_name
                 is_income,
@@ -277,8 +360,13 @@ class WalletToCashewCleanMigrator:
             debt['cashew_objective_pk'] = objective_pk
             objective_order += 1
         
-        self.conn.commit()
-        print(f"Created {len([d for d in self.debts if not d.get('deleted', False)])} objectives from debts")
+        self.cursor.executemany("""
+            INSERT INTO objectives (objective_pk, type, name, amount, "order", colour,
+                                  date_created, end_date, date_time_modified, icon_name,
+                                  emoji_icon_name, income, pinned, archived, wallet_fk)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        print(f"Created {len(self.active_debts)} objectives from debts")
     
     def create_transactions(self):
         """Create transactions in Cashew database with proper debt linking"""
@@ -286,18 +374,24 @@ class WalletToCashewCleanMigrator:
         
         # Create a mapping of debt IDs to objective IDs
         debt_to_objective = {}
-        for debt in self.debts:
-            if not debt.get('deleted', False) and 'cashew_objective_pk' in debt:
+        for debt in self.active_debts:
+            if 'cashew_objective_pk' in debt:
                 debt_to_objective[debt['_id']] = debt['cashew_objective_pk']
         
         # Track associated titles for the associated_titles table
         associated_titles = {}  # title -> category_pk mapping
         
-        for transaction in self.transactions:
-            if transaction.get('deleted', False):
-                continue
-                
-            transaction_pk = self.generate_id()
+        ts = self._ts_conv
+        now_ms = self.now_ms
+        date_time_modified = self.DATE_TIME_MODIFIED
+        format_amount = self.format_amount
+        generate_id = self.generate_id
+        account_to_wallet_pk = self.account_to_wallet_pk
+        category_to_pk = self.category_to_pk
+        rows = []
+        
+        for transaction in self.active_transactions:
+            transaction_pk = generate_id()
             
             # Extract payee and note from transaction
             payee = transaction.get('payee', '')
@@ -311,46 +405,29 @@ class WalletToCashewCleanMigrator:
             # Set note: use the note field, or empty if no note
             transaction_note = note if note else ''
             
-            amount = self.format_amount(float(transaction.get('amount', 0)))
+            amount = format_amount(float(transaction.get('amount', 0)))
             
             # Get category reference
-            category_id = transaction.get('categoryId')
-            category_pk = '1'  # Default to first category
-            if category_id and category_id in self.categories:
-                category_pk = self.categories[category_id].get('cashew_category_pk', '1')
+            category_pk = category_to_pk.get(transaction.get('categoryId'), '1')  # '1' = first category
             
             # Get wallet reference (accountId -> wallet_fk)
-            account_id = transaction.get('accountId')
-            wallet_pk = '0'  # Default wallet
-            if account_id and account_id in self.accounts:
-                wallet_pk = self.accounts[account_id].get('cashew_wallet_pk', '0')
+            wallet_pk = account_to_wallet_pk.get(transaction.get('accountId'), '0')  # '0' = default wallet
             
             # Determine if it's income
             is_income = 1 if amount > 0 else 0
             
+            date_created = ts(transaction.get('date', now_ms))
+            
             # Check if this transaction is linked to a debt via refObjects
-            objective_pk = None
-            objective_loan_pk = None
-            
-            if 'refObjects' in transaction and transaction['refObjects']:
-                for ref_obj in transaction['refObjects']:
-                    if ref_obj['id'] in debt_to_objective:
-                        objective_pk = debt_to_objective[ref_obj['id']]
-                        objective_loan_pk = debt_to_objective[ref_obj['id']]
-                        break
-            
-            self.cursor.execute("""
-                INSERT INTO transactions (transaction_pk, paired_transaction_fk, name, amount, note,
-                                        category_fk, sub_category_fk, wallet_fk, date_created,
-                                        date_time_modified, original_date_due, income, period_length,
-                                        reoccurrence, end_date, upcoming_transaction_notification,
-                                        type, paid, created_another_future_transaction, skip_paid,
-                                        method_added, transaction_owner_email, transaction_original_owner_email,
-                                        shared_key, shared_old_key, shared_status, shared_date_updated,
-                                        shared_reference_budget_pk, objective_fk, objective_loan_fk,
-                                        budget_fks_exclude)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
+            objective_pk = next(
+                (debt_to_objective[ref_obj['id']]
+                 for ref_obj in transaction.get('refObjects') or ()
+                 if ref_obj['id'] in debt_to_objective),
+                None
+            )
+            objective_loan_pk = objective_pk
+            
+            rows.append((
                 transaction_pk,
                 None,  # paired_transaction_fk
                 title,  # name (title)
@@ -359,9 +436,9 @@ class WalletToCashewCleanMigrator:
                 category_pk,
                 None,  # sub_category_fk
                 wallet_pk,
-                self.timestamp_to_unix(transaction.get('date', int(time.time() * 1000))),
-                1757158578,  # date_time_modified
-                self.timestamp_to_unix(transaction.get('date', int(time.time() * 1000))),  # original_date_due
+                date_created,
+                date_time_modified,
+                date_created,  # original_date_due
                 is_income,
                 None,  # period_length
                 None,  # reoccurrence
@@ -388,8 +465,19 @@ class WalletToCashewCleanMigrator:
             if title and title != 'Transaction':
                 associated_titles[title] = category_pk
         
-        self.conn.commit()
-        print(f"Created {len([t for t in self.transactions if not t.get('deleted', False)])} transactions")
+        self.cursor.executemany("""
+            INSERT INTO transactions (transaction_pk, paired_transaction_fk, name, amount, note,
+                                    category_fk, sub_category_fk, wallet_fk, date_created,
+                                    date_time_modified, original_date_due, income, period_length,
+                                    reoccurrence, end_date, upcoming_transaction_notification,
+                                    type, paid, created_another_future_transaction, skip_paid,
+                                    method_added, transaction_owner_email, transaction_original_owner_email,
+                                    shared_key, shared_old_key, shared_status, shared_date_updated,
+                                    shared_reference_budget_pk, objective_fk, objective_loan_fk,
+                                    budget_fks_exclude)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        print(f"Created {len(self.active_transactions)} transactions")
         
         # Create associated_titles entries
         self.create_associated_titles(associated_titles)
@@ -398,43 +486,48 @@ class WalletToCashewCleanMigrator:
         """Create associated_titles entries for automatic categorization"""
         print("Creating associated titles...")
         
-        # Get existing associated titles to avoid duplicates
-        self.cursor.execute("SELECT title FROM associated_titles")
-        existing_titles = {row[0] for row in self.cursor.fetchall()}
-        
-        # Get existing category order for associated titles
-        self.cursor.execute("SELECT MAX(\"order\") FROM associated_titles")
-        max_order = self.cursor.fetchone()[0] or 0
-        
-        order_counter = max_order + 1
-        created_count = 0
-        
-        for title, category_pk in associated_titles.items():
-            # Skip if title already exists
-            if title in existing_titles:
-                continue
-            
-            associated_title_pk = self.generate_id()
-            
-            self.cursor.execute("""
-                INSERT INTO associated_titles (associated_title_pk, category_fk, title, date_created,
-                                            date_time_modified, "order", is_exact_match)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (
-                associated_title_pk,
+        # The database is created fresh, so associated_titles starts empty and
+        # titles are already unique as dict keys: no lookup or dedup query needed
+        generate_id = self.generate_id
+        now_s = self.now_s
+        date_time_modified = self.DATE_TIME_MODIFIED
+        rows = [
+            (
+                generate_id(),
                 category_pk,
                 title,
-                int(time.time()),
-                1757158578,  # date_time_modified
-                order_counter,
+                now_s,
+                date_time_modified,
+                order,
                 0  # is_exact_match (0 = false)
-            ))
-            
-            order_counter += 1
-            created_count += 1
-        
-        self.conn.commit()
-        print(f"Created {created_count} associated titles")
+            )
+            for order, (title, category_pk) in enumerate(associated_titles.items(), 1)
+        ]
+        
+        self.cursor.executemany("""
+            INSERT INTO associated_titles (associated_title_pk, category_fk, title, date_created,
+                                        date_time_modified, "order", is_exact_match)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        print(f"Created {len(rows)} associated titles")
+    
+    def summarize_debts(self) -> Dict[str, Any]:
+        """Count and total active debts by type in a single pass"""
+        format_amount = self.format_amount
+        totals = {'total_amount': 0, 'borrowed_count': 0, 'borrowed_amount': 0, 'lent_count': 0, 'lent_amount': 0}
+        
+        for debt in self.active_debts:
+            amount = format_amount(abs(float(debt.get('amount', 0))))
+            totals['total_amount'] += amount
+            debt_type = debt.get('type')
+            if debt_type == 0:
+                totals['borrowed_count'] += 1
+                totals['borrowed_amount'] += amount
+            elif debt_type == 1:
+                totals['lent_count'] += 1
+                totals['lent_amount'] += amount
+        
+        return totals
     
     def generate_debt_summary(self):
         """Generate comprehensive debt summary with all associated records"""
@@ -442,103 +535,87 @@ class WalletToCashewCleanMigrator:
         print("COMPREHENSIVE DEBT SUMMARY")
         print("="*80)
         
-        # Create debt summary file
-        with open('output/debt_summary.txt', 'w', encoding='utf-8') as f:
-            f.write("WALLET BY BUDGETBAKERS TO CASHEW DEBT MIGRATION SUMMARY\n")
-            f.write("="*80 + "\n\n")
-            
-            # Get active debts
-            active_debts = [d for d in self.debts if not d.get('deleted', False)]
-            
-            # Group debts by type
-            borrowed_debts = [d for d in active_debts if d.get('type') == 0]
-            lent_debts = [d for d in active_debts if d.get('type') == 1]
-            
-            # Calculate totals
-            total_debt_amount = sum(self.format_amount(abs(float(d.get('amount', 0)))) for d in active_debts)
-            borrowed_amount = sum(self.format_amount(abs(float(d.get('amount', 0)))) for d in borrowed_debts)
-            lent_amount = sum(self.format_amount(abs(float(d.get('amount', 0)))) for d in lent_debts)
-            
-            f.write(f"OVERVIEW:\n")
-            f.write(f"  Total Debts: {len(active_debts)}\n")
-            f.write(f"  Money Borrowed: {len(borrowed_debts)} debts ({borrowed_amount:,.2f} PKR)\n")
-            f.write(f"  Money Lent: {len(lent_debts)} debts ({lent_amount:,.2f} PKR)\n")
-            f.write(f"  Total Amount: {total_debt_amount:,.2f} PKR\n\n")
-            
-            # Detailed debt analysis
-            f.write("DETAILED DEBT ANALYSIS:\n")
-            f.write("-" * 50 + "\n\n")
-            
-            for i, debt in enumerate(active_debts, 1):
-                debt_id = debt['_id']
-                name = debt.get('name', 'Unknown')
-                amount = self.format_amount(abs(float(debt.get('amount', 0))))
-                debt_type = debt.get('type', 0)
-                type_text = "BORROWED" if debt_type == 0 else "LENT"
-                
-                # Get account info
-                account_id = debt.get('accountId')
-                account_name = "Unknown Account"
-                if account_id and account_id in self.accounts:
-                    account_name = self.accounts[account_id].get('name', 'Unknown Account')
-                
-                # Get dates
-                created_date = debt.get('date', 'Unknown')
-                payback_date = debt.get('payBackTime', 'Not set')
-                paid_back = debt.get('paidBack', False)
-                
-                f.write(f"{i}. {name} ({type_text})\n")
-                f.write(f"   Amount: {amount:,.2f} PKR\n")
-                f.write(f"   Account: {account_name}\n")
-                f.write(f"   Created: {created_date}\n")
-                f.write(f"   Payback Date: {payback_date}\n")
-                f.write(f"   Paid Back: {'Yes' if paid_back else 'No'}\n")
-                f.write(f"   Debt ID: {debt_id}\n")
-                
-                # Find associated transactions
-                associated_transactions = []
-                for transaction in self.transactions:
-                    if not transaction.get('deleted', False) and 'refObjects' in transaction and transaction['refObjects']:
-                        for ref_obj in transaction['refObjects']:
-                            if ref_obj['id'] == debt_id:
-                                associated_transactions.append(transaction)
-                                break
-                
-                f.write(f"   Associated Transactions: {len(associated_transactions)}\n")
-                
-                if associated_transactions:
-                    f.write(f"   Transaction Details:\n")
-                    for j, trans in enumerate(associated_transactions[:5], 1):  # Show first 5 transactions
-                        trans_amount = self.format_amount(float(trans.get('amount', 0)))
-                        trans_note = trans.get('note', 'No note')
-                        trans_date = trans.get('date', 'Unknown date')
-                        f.write(f"     {j}. {trans_note} - {trans_amount:,.2f} PKR ({trans_date})\n")
-                    
-                    if len(associated_transactions) > 5:
-                        f.write(f"     ... and {len(associated_transactions) - 5} more transactions\n")
+        # Build the report in memory and write it out in one call
+        parts = []
+        write = parts.append
+        
+        write("WALLET BY BUDGETBAKERS TO CASHEW DEBT MIGRATION SUMMARY\n")
+        write("="*80 + "\n\n")
+        
+        # Get active debts
+        active_debts = self.active_debts
+        
+        # Calculate totals by type
+        totals = self.summarize_debts()
+        
+        write(f"OVERVIEW:\n")
+        write(f"  Total Debts: {len(active_debts)}\n")
+        write(f"  Money Borrowed: {totals['borrowed_count']} debts ({totals['borrowed_amount']:,.2f} PKR)\n")
+        write(f"  Money Lent: {totals['lent_count']} debts ({totals['lent_amount']:,.2f} PKR)\n")
+        write(f"  Total Amount: {totals['total_amount']:,.2f} PKR\n\n")
+        
+        # Detailed debt analysis
+        write("DETAILED DEBT ANALYSIS:\n")
+        write("-" * 50 + "\n\n")
+        
+        for i, debt in enumerate(active_debts, 1):
+            debt_id = debt['_id']
+            name = debt.get('name', 'Unknown')
+            amount = self.format_amount(abs(float(debt.get('amount', 0))))
+            debt_type = debt.get('type', 0)
+            type_text = "BORROWED" if debt_type == 0 else "LENT"
+            
+            # Get account info
+            account_id = debt.get('accountId')
+            account_name = "Unknown Account"
+            if account_id and account_id in self.accounts:
+                account_name = self.accounts[account_id].get('name', 'Unknown Account')
+            
+            # Get dates
+            created_date = debt.get('date', 'Unknown')
+            payback_date = debt.get('payBackTime', 'Not set')
+            paid_back = debt.get('paidBack', False)
+            
+            write(f"{i}. {name} ({type_text})\n")
+            write(f"   Amount: {amount:,.2f} PKR\n")
+            write(f"   Account: {account_name}\n")
+            write(f"   Created: {created_date}\n")
+            write(f"   Payback Date: {payback_date}\n")
+            write(f"   Paid Back: {'Yes' if paid_back else 'No'}\n")
+            write(f"   Debt ID: {debt_id}\n")
+            
+            # Find associated transactions
+            associated_transactions = self.debt_to_txns.get(debt_id, [])
+            
+            write(f"   Associated Transactions: {len(associated_transactions)}\n")
+            
+            if associated_transactions:
+                write(f"   Transaction Details:\n")
+                for j, trans in enumerate(associated_transactions[:5], 1):  # Show first 5 transactions
+                    trans_amount = self.format_amount(float(trans.get('amount', 0)))
+                    trans_note = trans.get('note', 'No note')
+                    trans_date = trans.get('date', 'Unknown date')
+                    write(f"     {j}. {trans_note} - {trans_amount:,.2f} PKR ({trans_date})\n")
                 
-                f.write(f"   Cashew Objective ID: {debt.get('cashew_objective_pk', 'Not created')}\n")
-                f.write("\n")
-            
-            # Summary statistics
-            f.write("MIGRATION STATISTICS:\n")
-            f.write("-" * 30 + "\n")
-            f.write(f"Total Wallets Created: {len([a for a in self.accounts.values() if not a.get('deleted', False)])}\n")
-            f.write(f"Total Categories Created: {len([c for c in self.categories.values() if not c.get('deleted', False)])}\n")
-            f.write(f"Total Objectives Created: {len(active_debts)}\n")
-            f.write(f"Total Transactions Created: {len([t for t in self.transactions if not t.get('deleted', False)])}\n")
-            
-            # Count debt-linked transactions
-            debt_linked_transactions = 0
-            for transaction in self.transactions:
-                if not transaction.get('deleted', False) and 'refObjects' in transaction and transaction['refObjects']:
-                    for ref_obj in transaction['refObjects']:
-                        if any(ref_obj['id'] == debt['_id'] for debt in active_debts):
-                            debt_linked_transactions += 1
-                            break
-            
-            f.write(f"Debt-Linked Transactions: {debt_linked_transactions}\n")
-            f.write(f"Migration Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+                if len(associated_transactions) > 5:
+                    write(f"     ... and {len(associated_transactions) - 5} more transactions\n")
+            
+            write(f"   Cashew Objective ID: {debt.get('cashew_objective_pk', 'Not created')}\n")
+            write("\n")
+        
+        # Summary statistics
+        write("MIGRATION STATISTICS:\n")
+        write("-" * 30 + "\n")
+        write(f"Total Wallets Created: {len(self.active_accounts)}\n")
+        write(f"Total Categories Created: {len(self.active_categories)}\n")
+        write(f"Total Objectives Created: {len(active_debts)}\n")
+        write(f"Total Transactions Created: {len(self.active_transactions)}\n")
+        
+        write(f"Debt-Linked Transactions: {self.debt_linked_count}\n")
+        write(f"Migration Date: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        
+        with open('output/debt_summary.txt', 'w', encoding='utf-8') as f:
+            f.write("".join(parts))
         
         print("✅ Comprehensive debt summary saved to debt_summary.txt")
     
@@ -549,10 +626,10 @@ class WalletToCashewCleanMigrator:
         print("="*60)
         
         # Count active items
-        active_accounts = len([a for a in self.accounts.values() if not a.get('deleted', False)])
-        active_categories = len([c for c in self.categories.values() if not c.get('deleted', False)])
-        active_debts = len([d for d in self.debts if not d.get('deleted', False)])
-        active_transactions = len([t for t in self.transactions if not t.get('deleted', False)])
+        active_accounts = len(self.active_accounts)
+        active_categories = len(self.active_categories)
+        active_debts = len(self.active_debts)
+        active_transactions = len(self.active_transactions)
         
         print(f"✅ Wallets created: {active_accounts}")
         print(f"✅ Categories created: {active_categories}")
@@ -560,26 +637,15 @@ class WalletToCashewCleanMigrator:
         print(f"✅ Transactions created: {active_transactions}")
         
         # Debt summary with proper categorization
-        total_debt_amount = sum(self.format_amount(abs(float(d.get('amount', 0)))) for d in self.debts if not d.get('deleted', False))
-        borrowed_amount = sum(self.format_amount(abs(float(d.get('amount', 0)))) for d in self.debts if not d.get('deleted', False) and d.get('type') == 0)
-        lent_amount = sum(self.format_amount(abs(float(d.get('amount', 0)))) for d in self.debts if not d.get('deleted', False) and d.get('type') == 1)
+        totals = self.summarize_debts()
         
         print(f"\n💰 DEBT SUMMARY:")
-        print(f"   Total debt amount: {total_debt_amount:,.2f} PKR")
-        print(f"   Money borrowed (type=0): {borrowed_amount:,.2f} PKR")
-        print(f"   Money lent (type=1): {lent_amount:,.2f} PKR")
-        
-        # Count debt-linked transactions
-        debt_linked_transactions = 0
-        for transaction in self.transactions:
-            if not transaction.get('deleted', False) and 'refObjects' in transaction and transaction['refObjects']:
-                for ref_obj in transaction['refObjects']:
-                    if any(ref_obj['id'] == debt['_id'] for debt in self.debts if not debt.get('deleted', False)):
-                        debt_linked_transactions += 1
-                        break
+        print(f"   Total debt amount: {totals['total_amount']:,.2f} PKR")
+        print(f"   Money borrowed (type=0): {totals['borrowed_amount']:,.2f} PKR")
+        print(f"   Money lent (type=1): {totals['lent_amount']:,.2f} PKR")
         
         print(f"\n🔗 DEBT-LINKED TRANSACTIONS:")
-        print(f"   Transactions linked to debts: {debt_linked_transactions}")
+        print(f"   Transactions linked to debts: {self.debt_linked_count}")
         
         print(f"\n📁 OUTPUT FILES:")
         print(f"   Clean Cashew Database: {self.cashew_db_path}")
@@ -603,19 +669,36 @@ class WalletToCashewCleanMigrator:
         
         try:
             self.load_data()
+            
+            # Load everything in one transaction: a single journal sync at COMMIT
+            self.cursor.execute("BEGIN")
             self.create_wallets()
             self.create_categories()
             self.create_objectives_from_debts()
             self.create_transactions()
-            self.generate_debt_summary()
-            self.generate_migration_summary()
+            self.create_indexes()
+            self.conn.commit()
             
         except Exception as e:
             print(f"❌ Migration failed: {str(e)}")
-            self.conn.rollback()
+            if self.conn.in_transaction:
+                self.conn.rollback()
             raise
         finally:
-            self.conn.close()
+            self.close()
+        
+        # Reports only read in-memory state, so they run after the database is released
+        self.generate_debt_summary()
+        self.generate_migration_summary()
+    
+    def close(self):
+        """Finalize and close the Cashew database"""
+        self.conn.execute("PRAGMA optimize")
+        # Fold the WAL back in so the app gets a single self-contained file
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        # Finalize the cursor's statement so closing releases the exclusive lock
+        self.cursor.close()
+        self.conn.close()
 
 if __name__ == "__main__":
     migrator = WalletToCashewCleanMigrator("wallet-to-cashew.sql")